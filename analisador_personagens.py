@@ -13,19 +13,28 @@ Dependências principais:
 - pandas, seaborn, matplotlib: Para manipulação de dados e criação de gráficos.
 - networkx, pyvis: Para análise e visualização de redes de relacionamentos.
 - python-louvain: Para detecção de comunidades em redes.
+- igraph, leidenalg (opcionais): Centralidade de intermediação em C e detecção de
+  comunidades mais rápida, pelo algoritmo de Leiden.
 """
 
 # --- IMPORTAÇÕES ---
 import os
-import re
 import gc
+import pickle
+import multiprocessing
+import sys
 import time
-from itertools import combinations
-from collections import Counter, defaultdict
+from array import array
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor
+from collections import Counter, defaultdict, deque
+from functools import lru_cache
+from operator import itemgetter
 from pathlib import Path
 
 # Bibliotecas de processamento e análise
 import spacy
+from spacy.attrs import SENT_START
 import fitz  # PyMuPDF
 import pandas as pd
 import numpy as np
@@ -39,13 +48,176 @@ import ebooklib
 from ebooklib import epub
 from bs4 import BeautifulSoup
 
-# Módulo de detecção de comunidades
+# igraph (implementado em C) acelera a centralidade de intermediação e, junto
+# com 'leidenalg', a detecção de comunidades pelo algoritmo de Leiden; sem eles,
+# usa-se o networkx e o algoritmo de Louvain
+try:
+    import igraph as ig
+except ImportError:
+    ig = None
+
+try:
+    import leidenalg
+except ImportError:
+    leidenalg = None
+
 try:
     import community.community_louvain as community_louvain
 except ImportError:
-    print("Aviso: A biblioteca 'python-louvain' não foi encontrada. A funcionalidade de detecção de comunidades não estará disponível.")
     community_louvain = None
 
+DETECCAO_COMUNIDADES_DISPONIVEL = leidenalg is not None or community_louvain is not None
+if not DETECCAO_COMUNIDADES_DISPONIVEL:
+    print("Aviso: A biblioteca 'python-louvain' não foi encontrada. A funcionalidade de detecção de comunidades não estará disponível.")
+
+
+# --- CONFIGURAÇÕES ---
+
+# Versão do formato e da lógica dos resultados; deve ser incrementada sempre que uma
+# mudança na análise alterar os resultados, invalidando os que foram salvos antes
+VERSAO_RESULTADOS = 2
+
+# Componentes do pipeline do spaCy que não contribuem para a extração de personagens.
+# O 'senter' estatístico, que vem desativado no modelo, também fica de fora: as
+# fronteiras de sentença vêm do 'sentencizer', baseado em regras
+COMPONENTES_SPACY_NAO_UTILIZADOS = [
+    "tagger", "morphologizer", "lemmatizer", "attribute_ruler", "parser", "senter"
+]
+
+# Número de textos (páginas ou capítulos) agrupados em cada lote de `nlp.pipe`
+TAMANHO_LOTE_NLP = 32
+TAMANHO_LOTE_NLP_GPU = 64
+
+# Tamanho mínimo do livro, em caracteres (EPUB) ou páginas (PDF), para que o NER rode em
+# processos filhos: abaixo disso, iniciar os processos e copiar o modelo custa mais do que economiza
+MIN_CARACTERES_PROCESSAMENTO_PARALELO = 500_000
+MIN_PAGINAS_PROCESSAMENTO_PARALELO = 250
+# Páginas de PDF extraídas e analisadas por tarefa de um processo filho
+PAGINAS_POR_TAREFA = 25
+
+# Processos filhos sem 'fork', que pode travar no servidor multithread do Streamlit;
+# o preload só vale quando este módulo é importável a partir do diretório atual
+if "forkserver" in multiprocessing.get_all_start_methods():
+    CONTEXTO_PROCESSOS = multiprocessing.get_context("forkserver")
+    CONTEXTO_PROCESSOS.set_forkserver_preload([__name__])
+else:
+    CONTEXTO_PROCESSOS = multiprocessing.get_context("spawn")
+
+# Opções de extração de texto do PyMuPDF: só o texto bruto, na ordem do arquivo
+# (sem reordenar blocos) e com as ligaduras tipográficas expandidas ("ﬁ" -> "fi"),
+# o que também facilita o reconhecimento dos nomes
+FLAGS_TEXTO_PDF = fitz.TEXT_PRESERVE_WHITESPACE | fitz.TEXT_MEDIABOX_CLIP
+
+# Fator aplicado às coordenadas do layout (entre -1 e 1) para a tela do pyvis, em pixels
+ESCALA_LAYOUT = 1000
+
+# Número máximo de nós de origem amostrados no cálculo da centralidade de intermediação
+AMOSTRAS_CENTRALIDADE = 32
+
+# Número de faixas do histograma do gráfico de evolução (uma por ponto percentual)
+FAIXAS_EVOLUCAO = 100
+
+# Títulos removidos dos nomes (comparados em minúsculas, como palavras inteiras)
+_TITULOS = frozenset(
+    titulo.lower() for titulo in [
+        'Sor', 'Lorde', 'Lady', 'Rei', 'Rainha', 'Senhor', 'Senhora',
+        'Príncipe', 'Princesa', 'Dom', 'Dona'
+    ]
+)
+
+
+# --- FUNÇÕES AUXILIARES ---
+
+@lru_cache(maxsize=100_000)
+def _limpar_nome_em_cache(nome_texto):
+    """Implementação memoizada de `AnalisadorDePersonagens._limpar_nome`."""
+    return ' '.join(palavra for palavra in nome_texto.split() if palavra.lower() not in _TITULOS)
+
+
+def _extrair_personagens_por_frase(doc_nlp):
+    """Gera (posição da frase, nomes já limpos e sem repetição) para cada frase com personagens."""
+    # Compara o id numérico do rótulo, evitando a consulta ao StringStore de `ent.label_`
+    rotulo_per = doc_nlp.vocab.strings["PER"]
+    entidades = [ent for ent in doc_nlp.ents if ent.label == rotulo_per]
+    if not entidades:
+        return
+
+    # Localiza a frase de cada entidade por busca binária nos tokens que iniciam frases
+    inicia_frase = doc_nlp.to_array(SENT_START) == 1
+    inicia_frase[0] = True
+    inicios_frases = np.flatnonzero(inicia_frase)
+    # Fim (exclusivo) de cada frase, em tokens
+    fins_frases = np.append(inicios_frases[1:], len(doc_nlp))
+    frases = np.searchsorted(inicios_frases, [ent.start for ent in entidades], side='right') - 1
+
+    # Os nomes de cada frase ficam em um dict (como conjunto ordenado): a ordem da
+    # primeira menção não depende do hash das strings, que muda entre processos
+    frase_atual, personagens_na_frase = None, {}
+    for ent, frase in zip(entidades, frases.tolist()):
+        if frase != frase_atual:
+            if personagens_na_frase:
+                yield doc_nlp[inicios_frases[frase_atual]].idx, personagens_na_frase
+            frase_atual, personagens_na_frase = frase, {}
+        # Assim como em `sent.ents`, ignora entidades que atravessam o fim da frase
+        if ent.end > fins_frases[frase]:
+            continue
+        # O nome é limpo uma única vez, e os filtros mais baratos vêm primeiro. Como as
+        # palavras do nome limpo são separadas por um único espaço, contá-los basta
+        # para limitar o nome a três palavras, sem criar uma lista com `split`
+        nome = _limpar_nome_em_cache(ent.text)
+        if len(nome) <= 2 or nome.count(' ') >= 3:
+            continue
+        personagens_na_frase[nome] = None
+
+    if personagens_na_frase:
+        yield doc_nlp[inicios_frases[frase_atual]].idx, personagens_na_frase
+
+
+# --- FUNÇÕES EXECUTADAS EM PROCESSOS SEPARADOS ---
+
+# Modelo spaCy de cada processo de análise, definido uma única vez em `_inicializar_processo_nlp`
+_nlp_do_processo = None
+
+
+def _inicializar_processo_nlp(nlp):
+    """Guarda, no processo filho, a cópia do modelo spaCy recebida do processo principal."""
+    global _nlp_do_processo
+    _nlp_do_processo = nlp
+
+
+def _analisar_texto_em_processo(texto):
+    """
+    Processa um texto no processo filho e devolve apenas as frases com personagens,
+    evitando serializar o `Doc` completo de volta para o processo principal.
+    """
+    return [
+        (posicao_frase, tuple(personagens_na_frase))
+        for posicao_frase, personagens_na_frase in _extrair_personagens_por_frase(_nlp_do_processo(texto))
+    ]
+
+
+# Documento PDF de cada processo de análise, aberto uma única vez em `_inicializar_processo_pdf`
+_pdf_do_processo = None
+
+
+def _inicializar_processo_pdf(nlp, pdf_input):
+    """Guarda o modelo spaCy e abre o PDF (caminho ou bytes) recebidos do processo principal."""
+    global _pdf_do_processo
+    _inicializar_processo_nlp(nlp)
+    if isinstance(pdf_input, bytes):
+        _pdf_do_processo = fitz.open(stream=pdf_input, filetype="pdf")
+    else:
+        _pdf_do_processo = fitz.open(pdf_input)
+
+
+def _analisar_intervalo_pdf(inicio, fim):
+    """Extrai e processa as páginas [inicio, fim) do PDF, devolvendo (tamanho, frases) de cada uma."""
+    paginas = []
+    for num_pagina in range(inicio, fim):
+        texto = _pdf_do_processo[num_pagina].get_text("text", flags=FLAGS_TEXTO_PDF, sort=False)
+        paginas.append((len(texto), _analisar_texto_em_processo(texto)))
+    return paginas
+
 
 # --- CLASSE DE LÓGICA DE ANÁLISE ---
 
@@ -53,12 +225,60 @@ class AnalisadorDePersonagens:
     """
     Classe unificada para extrair, analisar e visualizar dados de personagens de um texto.
     """
-    def __init__(self):
-        """Inicializa o analisador, carregando os modelos necessários."""
-        self.nlp = self._carregar_modelo_spacy()
+    def __init__(self, nlp=None, usa_gpu=False):
+        """
+        Inicializa o analisador, carregando os modelos necessários.
+
+        Args:
+            nlp (spacy.Language, opcional): Modelo já carregado por `carregar_modelo()`.
+                Permite que vários analisadores compartilhem o mesmo modelo, em vez de
+                cada um o ler novamente do disco.
+            usa_gpu (bool): Se o modelo informado em `nlp` roda na GPU, conforme
+                retornado por `carregar_modelo()`.
+        """
+        if nlp is None:
+            nlp, usa_gpu = self.carregar_modelo()
+        self.usa_gpu = usa_gpu
+        self.nlp = nlp
         self.resultados = self._inicializar_resultados()
         self.nlp.max_length = 2000000 
         self.total_caracteres = 0
+        self._inicializar_acumuladores()
+        self._limpar_caches()
+
+    def __getstate__(self):
+        """
+        Serializa o analisador sem o modelo spaCy, que é pesado e pode ser compartilhado;
+        um analisador restaurado recarrega o modelo só se fizer uma nova análise.
+        """
+        estado = self.__dict__.copy()
+        estado['nlp'] = None
+        return estado
+
+    @classmethod
+    def carregar_modelo(cls):
+        """
+        Carrega o modelo spaCy usado pelo analisador (ativando a GPU, se configurada).
+        Retorna o par (nlp, usa_gpu), que pode ser reaproveitado por várias instâncias
+        via `AnalisadorDePersonagens(nlp=nlp, usa_gpu=usa_gpu)`.
+        """
+        # A GPU precisa ser ativada antes de o modelo ser carregado
+        usa_gpu = cls._ativar_gpu()
+        return cls._carregar_modelo_spacy(), usa_gpu
+
+    @staticmethod
+    def _ativar_gpu():
+        """
+        Ativa o processamento em GPU do spaCy quando a variável de ambiente
+        'USE_GPU_NER' está definida. Sem GPU ou sem CuPy instalado, o spaCy
+        continua na CPU e o método retorna False.
+        """
+        if not os.environ.get("USE_GPU_NER"):
+            return False
+        usa_gpu = spacy.prefer_gpu()
+        if not usa_gpu:
+            print("Aviso: 'USE_GPU_NER' está definida, mas nenhuma GPU compatível foi encontrada. Usando a CPU.")
+        return usa_gpu
 
     @staticmethod
     def _carregar_modelo_spacy():
@@ -67,7 +287,10 @@ class AnalisadorDePersonagens:
         """
         modelo = "pt_core_news_sm"
         try:
-            return spacy.load(modelo)
+            # Apenas o NER e as fronteiras de sentença são usados na análise, então
+            # os demais componentes do pipeline nem chegam a ser carregados. O parser,
+            # que era a fonte das sentenças, é trocado pelo 'sentencizer'.
+            nlp = spacy.load(modelo, exclude=COMPONENTES_SPACY_NAO_UTILIZADOS)
         except OSError:
             # Em um ambiente de deploy, este erro significa que o modelo
             # não foi instalado corretamente via requirements.txt
@@ -76,6 +299,40 @@ class AnalisadorDePersonagens:
                 f"Certifique-se de que ele está listado corretamente em seu arquivo requirements.txt."
             )
 
+        if "ner" not in nlp.pipe_names:
+            raise RuntimeError(f"O modelo spaCy '{modelo}' não possui o componente 'ner' ativo.")
+        # Sem o parser e o morphologizer, o 'tok2vec' compartilhado pode ter ficado sem
+        # ouvintes (o NER dos modelos 'sm' tem as próprias camadas de embedding)
+        if "tok2vec" in nlp.pipe_names and not nlp.get_pipe("tok2vec").listening_components:
+            nlp.remove_pipe("tok2vec")
+        nlp.add_pipe("sentencizer", first=True)
+        return nlp
+
+    def _inicializar_acumuladores(self):
+        """Prepara os acumuladores, indexados pelo id inteiro de cada personagem, usados na leitura."""
+        self._ids = {}
+        self._nomes = []
+        self._ids_mencoes = array('i')
+        self._posicoes_mencoes = array('q')
+        self._elencos = Counter()
+
+    def _id_personagem(self, nome):
+        """Retorna o id inteiro do personagem, registrando-o na primeira ocorrência."""
+        id_personagem = self._ids.get(nome)
+        if id_personagem is None:
+            nome = sys.intern(nome)
+            id_personagem = self._ids[nome] = len(self._nomes)
+            self._nomes.append(nome)
+        return id_personagem
+
+    def _limpar_caches(self):
+        """Descarta os resultados intermediários derivados de uma análise anterior."""
+        self._cache_grafos = {}
+        self._cache_layouts = {}
+        self._cache_particoes = {}
+        self._cache_html = {}
+        self._ranking = None
+
     def _inicializar_resultados(self):
         """Retorna a estrutura de dados para armazenar os resultados da análise."""
         return {
@@ -84,16 +341,10 @@ class AnalisadorDePersonagens:
             "relacionamentos": Counter()
         }
 
-    def _limpar_nome(self, nome_texto):
+    @staticmethod
+    def _limpar_nome(nome_texto):
         """Remove títulos e excesso de espaços para agrupar nomes de personagens."""
-        titulos = [
-            'Sor', 'Lorde', 'Lady', 'Rei', 'Rainha', 'Senhor', 'Senhora',
-            'Príncipe', 'Princesa', 'Dom', 'Dona'
-        ]
-        # Expressão regular para remover os títulos como palavras inteiras
-        padrao = r'\b(' + '|'.join(titulos) + r')\b'
-        nome_limpo = re.sub(padrao, '', nome_texto, flags=re.IGNORECASE)
-        return nome_limpo.strip()
+        return _limpar_nome_em_cache(nome_texto)
     
     def _extrair_texto_epub(self, epub_input):
         """ 
@@ -117,7 +368,49 @@ class AnalisadorDePersonagens:
             # Retorna um gerador vazio para não quebrar o código que chama esta função
             yield from []
             
-    def analisar_livro(self, pdf_input, tamanho_chunk=100000):
+    def _processar_pdf(self, doc_pdf, pdf_input, n_processos=1):
+        """
+        Processa as páginas do PDF, acumulando `self.total_caracteres` à medida que são lidas.
+
+        Em PDFs longos, cada processo filho extrai e analisa intervalos de páginas, de modo
+        que o texto das páginas não precise passar pelo processo principal.
+        """
+        total_paginas = doc_pdf.page_count
+        if n_processos <= 1 or total_paginas < MIN_PAGINAS_PROCESSAMENTO_PARALELO:
+            paginas = self._acumular_posicoes(
+                page.get_text("text", flags=FLAGS_TEXTO_PDF, sort=False) for page in doc_pdf
+            )
+            self._processar_textos(paginas)
+            return
+
+        # O modelo e o PDF são enviados uma única vez a cada processo, na inicialização
+        with ProcessPoolExecutor(
+            max_workers=n_processos, mp_context=CONTEXTO_PROCESSOS,
+            initializer=_inicializar_processo_pdf, initargs=(self.nlp, pdf_input)
+        ) as executor:
+            # Mantém um número limitado de intervalos em andamento, registrados na ordem das páginas
+            pendentes = deque()
+            for inicio in range(0, total_paginas, PAGINAS_POR_TAREFA):
+                fim = min(inicio + PAGINAS_POR_TAREFA, total_paginas)
+                pendentes.append(executor.submit(_analisar_intervalo_pdf, inicio, fim))
+                if len(pendentes) >= 2 * n_processos:
+                    self._registrar_paginas(pendentes.popleft().result())
+            for futuro in pendentes:
+                self._registrar_paginas(futuro.result())
+
+    def _registrar_paginas(self, paginas):
+        """Contabiliza as páginas (tamanho, frases) analisadas em um processo filho."""
+        for tamanho, frases in paginas:
+            self._registrar_frases(frases, self.total_caracteres)
+            self.total_caracteres += tamanho
+
+    def _acumular_posicoes(self, textos):
+        """Associa cada texto à sua posição inicial no livro, atualizando o total de caracteres."""
+        for texto in textos:
+            yield texto, self.total_caracteres
+            self.total_caracteres += len(texto)
+
+    def analisar_livro(self, pdf_input, tamanho_chunk=100000, n_processos=None):
         """
         Processa um livro a partir de bytes de um arquivo PDF ou de um caminho de arquivo,
         otimizado para baixo consumo de memória.
@@ -125,10 +418,23 @@ class AnalisadorDePersonagens:
         Args:
             pdf_input (bytes or str): Os bytes do arquivo PDF ou o caminho para ele.
             tamanho_chunk (int): O tamanho dos blocos de texto a serem processados por vez.
+            n_processos (int, opcional): Número de processos usados no reconhecimento de
+                entidades em livros longos. Por padrão, usa até 4 núcleos da máquina.
         """
+        if self.nlp is None:
+            # Analisador restaurado de um pickle, que não inclui o modelo
+            self.nlp, self.usa_gpu = self.carregar_modelo()
+            self.nlp.max_length = 2000000
+
+        if n_processos is None:
+            # Na GPU, um único processo já alimenta o modelo; processos filhos não
+            # compartilhariam o contexto CUDA
+            n_processos = 1 if self.usa_gpu else min(os.cpu_count() or 1, 4)
+
         self.resultados = self._inicializar_resultados()
         self.total_caracteres = 0
-        posicao_atual = 0
+        self._inicializar_acumuladores()
+        self._limpar_caches()
 
         is_pdf = False
         if isinstance(pdf_input, str):
@@ -143,57 +449,23 @@ class AnalisadorDePersonagens:
                 else:
                     doc_pdf = fitz.open(pdf_input)
                 
-                # Pre-calcula o tamanho total para normalização sem carregar tudo na memória
-                self.total_caracteres = sum(len(page.get_text()) for page in doc_pdf)
+                with doc_pdf:
+                    self._processar_pdf(doc_pdf, pdf_input, n_processos)
+
                 if self.total_caracteres == 0:
                     raise ValueError("O PDF parece estar vazio ou não contém texto extraível.")
 
-                with doc_pdf:
-                    # Processa página por página para manter o uso de memória baixo
-                    for page_num, page in enumerate(doc_pdf):
-                        texto_pagina = page.get_text()
-                        if not texto_pagina:
-                            continue
-
-                        # Processa o texto da página com o modelo nlp
-                        doc_nlp = self.nlp(texto_pagina)
-                    
-                        for sent in doc_nlp.sents:
-                            personagens_na_frase = {
-                                self._limpar_nome(ent.text) for ent in sent.ents 
-                                if ent.label_ == "PER" and len(self._limpar_nome(ent.text).split()) < 4 and len(self._limpar_nome(ent.text)) > 2
-                            }
-                        
-                            if not personagens_na_frase:
-                                continue
-                        
-                            for p in personagens_na_frase:
-                                # Calcula a posição relativa à posição inicial da página
-                                posicao_absoluta = posicao_atual + sent.start_char
-                                self.resultados["frequencia"][p] += 1
-                                self.resultados["posicoes"][p].append(posicao_absoluta)
-                        
-                            if len(personagens_na_frase) > 1:
-                                for par in combinations(sorted(list(personagens_na_frase)), 2):
-                                    self.resultados["relacionamentos"][par] += 1
-                    
-                        # Atualiza a posição inicial para a próxima página
-                        posicao_atual += len(texto_pagina)
-                        gc.collect()
-            
             else:
                 # --- LÓGICA DO EPUB AJUSTADA PARA FUNCIONALIDADE ---
-                # Calculo do tamanho total para normalização
-                textos_epub = list(self._extrair_texto_epub(pdf_input))
-                self.total_caracteres = sum(len(texto) for texto in textos_epub)
+                # Os capítulos seguem o mesmo caminho em lote das páginas do PDF, e o
+                # tamanho total é acumulado durante a própria leitura
+                capitulos = self._acumular_posicoes(self._extrair_texto_epub(pdf_input))
+                self._processar_textos(capitulos, n_processos)
+
                 if self.total_caracteres == 0:
                     raise ValueError("O EPUB parece estar vazio ou não contém texto extraível. Verifique se o arquivo não possui DRM (proteção de cópia).")
-                
-                for texto_capitulo in textos_epub:
-                    self._processar_bloco_de_texto(texto_capitulo, posicao_atual)
-                    posicao_atual += len(texto_capitulo)
-                    gc.collect()
 
+            self._consolidar_resultados()
 
         except ValueError as ve:
             raise ve
@@ -202,52 +474,188 @@ class AnalisadorDePersonagens:
             # A exceção é levantada corretamente, em vez de ser ignorada
             raise RuntimeError(f"Erro ao ler ou processar o arquivo: {e}")
         finally:
+            # Uma única coleta ao final do livro; os `Doc`s de cada página já são
+            # liberados por contagem de referências à medida que o laço avança
             gc.collect()
 
-    def _processar_bloco_de_texto(self, texto, posicao_base):
-        """ Processa um bloco de texto com o modelo nlp para encontrar personagens."""
+    def _processar_doc(self, doc_nlp, posicao_base):
+        """Registra os personagens e relacionamentos de um documento já processado pelo spaCy."""
+        self._registrar_frases(_extrair_personagens_por_frase(doc_nlp), posicao_base)
 
-        if not texto:
-            return
-        
-        doc_nlp = self.nlp(texto)
+    def _processar_textos(self, textos_com_posicao, n_processos=1):
+        """
+        Processa uma sequência de pares (texto, posição inicial no livro).
 
-        for sent in doc_nlp.sents:
-            personagens_na_frase = {
-                self._limpar_nome(ent.text) for ent in sent.ents
-                if ent.label_ == "PER" and len(self._limpar_nome(ent.text).split()) < 4 and len(self._limpar_nome(ent.text)) > 2
-                
-            }
+        Com mais de um processo, o NER roda em processos filhos que recebem uma cópia
+        serializada do modelo e devolvem apenas as frases com personagens; a
+        contabilização continua no processo principal, na ordem original dos textos.
+        """
+        if n_processos > 1:
+            # Lê os primeiros textos até saber se o livro é longo o bastante para os processos
+            iniciais, tamanho = [], 0
+            textos_com_posicao = iter(textos_com_posicao)
+            for texto_com_posicao in textos_com_posicao:
+                iniciais.append(texto_com_posicao)
+                tamanho += len(texto_com_posicao[0])
+                if tamanho >= MIN_CARACTERES_PROCESSAMENTO_PARALELO:
+                    break
+            else:
+                n_processos = 1
+            textos_com_posicao = chain(iniciais, textos_com_posicao)
 
-            if not personagens_na_frase:
-                continue
+        if n_processos <= 1:
+            tamanho_lote = TAMANHO_LOTE_NLP_GPU if self.usa_gpu else TAMANHO_LOTE_NLP
+            for doc_nlp, posicao_texto in self.nlp.pipe(textos_com_posicao, as_tuples=True, batch_size=tamanho_lote):
+                self._processar_doc(doc_nlp, posicao_texto)
+            return
+
+        # O modelo é enviado uma única vez a cada processo, na inicialização
+        with ProcessPoolExecutor(
+            max_workers=n_processos, mp_context=CONTEXTO_PROCESSOS,
+            initializer=_inicializar_processo_nlp, initargs=(self.nlp,)
+        ) as executor:
+            # Mantém um número limitado de textos em andamento, para não carregar o livro
+            # inteiro na fila do executor
+            pendentes = deque()
+            for texto, posicao_texto in textos_com_posicao:
+                pendentes.append((executor.submit(_analisar_texto_em_processo, texto), posicao_texto))
+                if len(pendentes) >= 2 * n_processos:
+                    futuro, posicao_pendente = pendentes.popleft()
+                    self._registrar_frases(futuro.result(), posicao_pendente)
+            for futuro, posicao_pendente in pendentes:
+                self._registrar_frases(futuro.result(), posicao_pendente)
+
+    def _registrar_frases(self, frases, posicao_base):
+        """Contabiliza as frases (posição, personagens) de um texto que começa em `posicao_base`."""
+        for posicao_frase, personagens_na_frase in frases:
+            posicao_absoluta = posicao_base + posicao_frase
+            ids_na_frase = [self._id_personagem(p) for p in personagens_na_frase]
+            self._ids_mencoes.extend(ids_na_frase)
+            self._posicoes_mencoes.extend([posicao_absoluta] * len(ids_na_frase))
+
+            if len(ids_na_frase) > 1:
+                # Conta o "elenco" da frase; os pares são gerados uma única vez por
+                # elenco distinto em `_contar_pares`
+                self._elencos[tuple(sorted(ids_na_frase))] += 1
+
+    def _consolidar_resultados(self):
+        """
+        Converte os acumuladores indexados por id na estrutura `self.resultados`,
+        indexada pelos nomes dos personagens, e expande os elencos de cada frase
+        nos pares de personagens que coocorrem.
+        """
+        nomes = self._nomes
+        ids_mencoes = np.frombuffer(self._ids_mencoes, dtype=np.intc)
+        posicoes_mencoes = np.frombuffer(self._posicoes_mencoes, dtype=np.int64)
+
+        # As frequências são contadas de uma vez sobre a coluna de ids, em vez de
+        # um incremento por menção durante a leitura
+        frequencias = np.bincount(ids_mencoes, minlength=len(nomes))
+        self.resultados["frequencia"] = Counter(dict(zip(nomes, frequencias.tolist())))
+
+        # Agrupa as colunas de menções por personagem: a ordenação estável mantém
+        # as posições de cada personagem em ordem crescente, e as frequências
+        # indicam onde termina o bloco de cada um
+        ordem = np.argsort(ids_mencoes, kind='stable')
+        limites = np.cumsum(frequencias)[:-1]
+        self.resultados["posicoes"] = dict(zip(nomes, np.split(posicoes_mencoes[ordem], limites)))
+
+        self.resultados["relacionamentos"] = self._contar_pares()
+        self._inicializar_acumuladores()
+
+    def _contar_pares(self):
+        """Expande os elencos das frases em contagens de pares (em ordem alfabética) de personagens."""
+        nomes = self._nomes
+        n_personagens = len(nomes)
+        if not self._elencos or n_personagens < 2:
+            return Counter()
+
+        # Posição de cada id na ordem alfabética dos nomes
+        ordem_alfabetica = np.empty(n_personagens, dtype=np.int64)
+        ordem_alfabetica[sorted(range(n_personagens), key=nomes.__getitem__)] = np.arange(n_personagens)
+
+        elencos_por_tamanho = defaultdict(list)
+        for elenco, ocorrencias in self._elencos.items():
+            elencos_por_tamanho[len(elenco)].append((elenco, ocorrencias))
+
+        # Elencos de mesmo tamanho formam uma matriz, cujos pares saem de uma vez
+        # pelos índices do triângulo superior
+        chaves, pesos = [], []
+        for tamanho, grupo in elencos_por_tamanho.items():
+            elencos, ocorrencias = zip(*grupo)
+            matriz = np.sort(ordem_alfabetica[np.array(elencos)], axis=1)
+            i, j = np.triu_indices(tamanho, 1)
+            chaves.append((matriz[:, i] * n_personagens + matriz[:, j]).ravel())
+            pesos.append(np.repeat(np.array(ocorrencias, dtype=np.int64), len(i)))
+
+        chaves_unicas, indices = np.unique(np.concatenate(chaves), return_inverse=True)
+        contagens = np.bincount(indices, weights=np.concatenate(pesos)).astype(np.int64)
+
+        nomes_alfabeticos = sorted(nomes)
+        linhas, colunas = np.divmod(chaves_unicas, n_personagens)
+        return Counter({
+            (nomes_alfabeticos[a], nomes_alfabeticos[b]): c
+            for a, b, c in zip(linhas.tolist(), colunas.tolist(), contagens.tolist())
+        })
 
-            for p in personagens_na_frase:
-                posicao_absoluta = posicao_base + sent.start_char
-                self.resultados["frequencia"][p] += 1
-                self.resultados["posicoes"][p].append(posicao_absoluta)
+    def salvar_resultados(self, caminho):
+        """
+        Grava em `caminho` os resultados da última análise (sem o modelo spaCy),
+        para que possam ser recarregados com `carregar_resultados`.
+        """
+        caminho = Path(caminho)
+        caminho.parent.mkdir(parents=True, exist_ok=True)
+        with open(caminho, 'wb') as arquivo:
+            pickle.dump(
+                {"resultados": self.resultados, "total_caracteres": self.total_caracteres},
+                arquivo, protocol=pickle.HIGHEST_PROTOCOL
+            )
 
-            if len(personagens_na_frase) > 1:
-                for par in combinations(sorted(list(personagens_na_frase)), 2):
-                    self.resultados["relacionamentos"][par] += 1
+    def carregar_resultados(self, caminho):
+        """Carrega resultados gravados por `salvar_resultados`, dispensando uma nova análise."""
+        with open(caminho, 'rb') as arquivo:
+            dados = pickle.load(arquivo)
+        self.resultados = dados["resultados"]
+        self.total_caracteres = dados["total_caracteres"]
+        self._limpar_caches()
 
     # --- MÉTODOS DE GERAÇÃO DE GRÁFICOS (RETORNANDO OBJETOS FIG/HTML) ---
+
+    def _top_personagens(self, top_n=None):
+        """
+        Retorna os `top_n` pares (personagem, frequência) mais frequentes. A ordenação
+        completa é feita uma única vez por análise; as chamadas seguintes apenas
+        fatiam o ranking, qualquer que seja o `top_n`.
+        """
+        if self._ranking is None:
+            self._ranking = sorted(self.resultados["frequencia"].items(), key=itemgetter(1), reverse=True)
+        return self._ranking[:top_n]
+
+    def _posicoes_normalizadas(self, personagem):
+        """Retorna as posições das menções do personagem em percentual do texto (0 a 100)."""
+        posicoes = self.resultados["posicoes"].get(personagem)
+        # Verifica se total_caracteres não é zero para evitar divisão por zero
+        if posicoes is None or self.total_caracteres <= 0:
+            return np.empty(0, dtype=np.float32)
+        return np.asarray(posicoes).astype(np.float32) * (100.0 / self.total_caracteres)
     
     def gerar_grafico_frequencia(self, top_n=25):
         """Gera um gráfico de barras com a frequência dos personagens."""
-        mais_comuns = self.resultados["frequencia"].most_common(top_n)
+        mais_comuns = self._top_personagens(top_n)
         if not mais_comuns: return None
         
-        df = pd.DataFrame(mais_comuns, columns=['Personagem', 'Frequência'])
+        personagens, frequencias = zip(*mais_comuns)
         fig, ax = plt.subplots(figsize=(12, 8))
-        sns.barplot(x='Frequência', y='Personagem', data=df, palette='viridis', ax=ax)
+        sns.barplot(x=list(frequencias), y=list(personagens), palette='viridis', ax=ax)
+        ax.set_xlabel('Frequência')
+        ax.set_ylabel('Personagem')
         ax.set_title(f'Top {top_n} Personagens Mais Frequentes', fontsize=16)
         plt.tight_layout()
         return fig
 
     def gerar_grafico_dispersao(self, top_n=15):
         """Gera um gráfico de dispersão para mostrar onde os personagens aparecem no texto."""
-        personagens_principais = [p for p, _ in self.resultados["frequencia"].most_common(top_n)]
+        personagens_principais = [p for p, _ in self._top_personagens(top_n)]
         if not personagens_principais: return None
 
         n_personagens = len(personagens_principais)
@@ -257,13 +665,8 @@ class AnalisadorDePersonagens:
         cores = plt.cm.viridis(np.linspace(0, 1, n_personagens))
         for i, personagem in enumerate(personagens_principais):
             ax = axes[i]
-            # Verifica se total_caracteres não é zero para evitar divisão por zero
-            if self.total_caracteres > 0:
-                posicoes_norm = [(p / self.total_caracteres) * 100 for p in self.resultados["posicoes"].get(personagem, [])]
-            else:
-                posicoes_norm = []
-            
-            if posicoes_norm:
+            posicoes_norm = self._posicoes_normalizadas(personagem)
+            if posicoes_norm.size:
                 ax.vlines(posicoes_norm, ymin=0, ymax=1, color=cores[i], alpha=0.7)
             
             ax.set_yticks([])
@@ -278,20 +681,26 @@ class AnalisadorDePersonagens:
         return fig
 
     def gerar_grafico_evolucao_dinamico(self, personagens_selecionados):
-        """Gera um gráfico de densidade (KDE) para a evolução de personagens selecionados."""
+        """Gera um gráfico de densidade para a evolução de personagens selecionados."""
         if not personagens_selecionados: return None
         
         fig, ax = plt.subplots(figsize=(14, 8))
         cores = plt.cm.tab10(np.linspace(0, 1, len(personagens_selecionados)))
+        largura_faixa = 100 / FAIXAS_EVOLUCAO
         
         for i, personagem in enumerate(personagens_selecionados):
-            if self.total_caracteres > 0:
-                posicoes_norm = [(p / self.total_caracteres) * 100 for p in self.resultados["posicoes"].get(personagem, [])]
-            else:
-                posicoes_norm = []
-                
-            if posicoes_norm:
-                sns.kdeplot(posicoes_norm, label=personagem, fill=True, alpha=0.3, color=cores[i], ax=ax, linewidth=2)
+            posicoes_norm = self._posicoes_normalizadas(personagem)
+            if posicoes_norm.size:
+                densidade, limites = np.histogram(posicoes_norm, bins=FAIXAS_EVOLUCAO, range=(0, 100), density=True)
+                # Histograma suavizado por um filtro gaussiano com a largura da KDE do seaborn (regra de Scott)
+                sigma = max(float(posicoes_norm.std()) * posicoes_norm.size ** -0.2 / largura_faixa, 1.0)
+                alcance = min(int(3 * sigma), FAIXAS_EVOLUCAO - 1)
+                nucleo = np.exp(-0.5 * (np.arange(-alcance, alcance + 1) / sigma) ** 2)
+                densidade = np.convolve(densidade, nucleo / nucleo.sum(), mode='full')
+                densidade = densidade[alcance:alcance + FAIXAS_EVOLUCAO]
+                centros = (limites[:-1] + limites[1:]) / 2
+                ax.fill_between(centros, densidade, alpha=0.3, color=cores[i])
+                ax.plot(centros, densidade, label=personagem, color=cores[i], linewidth=2)
         
         ax.set_title('Evolução das Menções ao Longo do Livro', fontsize=16)
         ax.set_xlabel('Posição no Texto (%)', fontsize=12)
@@ -303,83 +712,143 @@ class AnalisadorDePersonagens:
         
     def _criar_grafo_base(self, top_n):
         """Helper para criar um grafo NetworkX com os personagens e relacionamentos."""
-        personagens_principais = {p for p, _ in self.resultados["frequencia"].most_common(top_n)}
-        if not personagens_principais:
+        mais_frequentes = self._top_personagens(top_n)
+        if not mais_frequentes:
             return None
 
+        personagens, frequencias = zip(*mais_frequentes)
+        personagens_principais = set(personagens)
+        # Tamanho dos nós proporcional ao log da frequência, calculado de uma só vez
+        tamanhos = (np.log1p(np.asarray(frequencias, dtype=np.float64)) * 5).tolist()
+
         G = nx.Graph()
-        # Adiciona nós com tamanho baseado na frequência
-        for p in personagens_principais:
-            freq = self.resultados["frequencia"][p]
-            G.add_node(p, size=np.log1p(freq) * 5, title=f"Menções: {freq}")
+        # Adiciona nós na ordem do ranking, com tamanho baseado na frequência
+        G.add_nodes_from(
+            (p, {"size": tamanho, "title": f"Menções: {freq}"})
+            for p, freq, tamanho in zip(personagens, frequencias, tamanhos)
+        )
         
         # Adiciona arestas com peso baseado na força da interação
-        for par, peso in self.resultados["relacionamentos"].items():
-            if par[0] in G and par[1] in G:
-                G.add_edge(par[0], par[1], weight=peso, title=f"Interações: {peso}")
+        G.add_edges_from(
+            (p1, p2, {"weight": peso, "title": f"Interações: {peso}"})
+            for (p1, p2), peso in self.resultados["relacionamentos"].items()
+            if p1 in personagens_principais and p2 in personagens_principais
+        )
         
         G.remove_nodes_from(list(nx.isolates(G))) # Remove personagens sem conexão
         return G if G.number_of_nodes() > 0 else None
 
-    def gerar_rede_relacionamentos(self, top_n=30):
-        """Gera um grafo interativo da rede de relacionamentos."""
-        G = self._criar_grafo_base(top_n)
+    def _obter_grafo_base(self, top_n):
+        """
+        Retorna o grafo base para `top_n`, construindo-o apenas na primeira chamada.
+        O grafo é compartilhado entre os relatórios: quem precisar modificá-lo deve
+        usar uma cópia.
+        """
+        if top_n not in self._cache_grafos:
+            self._cache_grafos[top_n] = self._criar_grafo_base(top_n)
+        return self._cache_grafos[top_n]
+
+    def _obter_layout(self, top_n):
+        """Retorna as coordenadas {personagem: (x, y)} do grafo base de `top_n`, calculadas uma única vez."""
+        if top_n not in self._cache_layouts:
+            posicoes = nx.spring_layout(self._obter_grafo_base(top_n), weight='weight', seed=0, iterations=50)
+            self._cache_layouts[top_n] = {
+                no: (float(x) * ESCALA_LAYOUT, float(y) * ESCALA_LAYOUT) for no, (x, y) in posicoes.items()
+            }
+        return self._cache_layouts[top_n]
+
+    def _montar_rede_pyvis(self, top_n, grupos=None):
+        """Monta a rede pyvis (sem física) do grafo base de `top_n` e retorna o seu HTML."""
+        G = self._obter_grafo_base(top_n)
         if not G: return None
-        
+        coordenadas = self._obter_layout(top_n)
+
         net = Network(height="800px", width="100%", bgcolor="#222222", font_color="white")
-        net.from_nx(G)
-        net.set_options("""
-        var options = {
-          "physics": {
-            "forceAtlas2Based": {
-              "gravitationalConstant": -100,
-              "centralGravity": 0.01,
-              "springLength": 200
-            },
-            "minVelocity": 0.75,
-            "solver": "forceAtlas2Based"
-          }
-        }
-        """)
+        # Um nó por vez: `add_nodes` converteria nomes como "1984" em ids inteiros
+        for no, atributos in G.nodes(data=True):
+            opcoes = {'size': int(atributos['size']), 'title': atributos['title'],
+                      'x': coordenadas[no][0], 'y': coordenadas[no][1]}
+            if grupos is not None:
+                opcoes['title'] += f"<br>Comunidade: {grupos[no]}"
+                opcoes['group'] = grupos[no]
+            net.add_node(no, **opcoes)
+        # As arestas do grafo já são únicas; dispensa-se a verificação de `add_edge`
+        net.edges.extend(
+            {"from": p1, "to": p2, "width": peso, "title": f"Interações: {peso}"}
+            for p1, p2, peso in G.edges(data='weight')
+        )
+        net.toggle_physics(False)
         return net.generate_html(notebook=False)
 
+    def gerar_rede_relacionamentos(self, top_n=30):
+        """Gera um grafo interativo da rede de relacionamentos."""
+        chave = ("relacionamentos", top_n)
+        if chave not in self._cache_html:
+            self._cache_html[chave] = self._montar_rede_pyvis(top_n)
+        return self._cache_html[chave]
+
+    def _detectar_comunidades(self, top_n):
+        """Retorna a partição {personagem: comunidade} do grafo base de `top_n`, por Leiden ou Louvain."""
+        if top_n not in self._cache_particoes:
+            G = self._obter_grafo_base(top_n)
+            if leidenalg is not None:
+                grafo_ig = ig.Graph.TupleList(G.edges(data='weight'), weights=True)
+                particao = leidenalg.find_partition(
+                    grafo_ig, leidenalg.ModularityVertexPartition, weights='weight', seed=0
+                )
+                self._cache_particoes[top_n] = dict(zip(grafo_ig.vs['name'], particao.membership))
+            else:
+                self._cache_particoes[top_n] = community_louvain.best_partition(G, weight='weight')
+        return self._cache_particoes[top_n]
+
     def gerar_rede_comunidades(self, top_n=50):
         """Gera um grafo interativo com detecção de comunidades (grupos)."""
-        if not community_louvain:
+        if not DETECCAO_COMUNIDADES_DISPONIVEL:
             print("Função 'gerar_rede_comunidades' desabilitada pois 'python-louvain' não está instalado.")
             return None
 
-        G = self._criar_grafo_base(top_n)
-        if not G: return None
-
-        partition = community_louvain.best_partition(G, weight='weight')
-        for node, comm_id in partition.items():
-            G.nodes[node]['group'] = comm_id
-            G.nodes[node]['title'] += f"<br>Comunidade: {comm_id}"
-
-        net = Network(height="800px", width="100%", bgcolor="#222222", font_color="white")
-        net.from_nx(G)
-        return net.generate_html(notebook=False)
+        chave = ("comunidades", top_n)
+        if chave not in self._cache_html:
+            if not self._obter_grafo_base(top_n): return None
+            self._cache_html[chave] = self._montar_rede_pyvis(top_n, grupos=self._detectar_comunidades(top_n))
+        return self._cache_html[chave]
         
     def analisar_pontes_narrativas(self, top_n=10):
-        """Identifica personagens-ponte através da centralidade de intermediação."""
-        G = self._criar_grafo_base(top_n=50) # Usa um grafo maior para a análise de centralidade
+        """
+        Identifica personagens-ponte através da centralidade de intermediação.
+
+        Com 'igraph' instalado, a centralidade é exata e calculada em C. Sem ele, o
+        networkx estima o valor a partir de uma amostra de até `AMOSTRAS_CENTRALIDADE`
+        personagens de origem (com semente fixa, para ser reprodutível); em grafos
+        com até esse número de nós, o cálculo também é exato.
+        """
+        G = self._obter_grafo_base(top_n=50) # Usa um grafo maior para a análise de centralidade
         if not G: return None
 
         # Calcula a centralidade
-        betweenness = nx.betweenness_centrality(G, weight='weight', normalized=True)
+        if ig is not None:
+            grafo_ig = ig.Graph.TupleList(G.edges(data='weight'), weights=True, directed=False)
+            n = grafo_ig.vcount()
+            # Mesma normalização do networkx para grafos não direcionados
+            escala = 2 / ((n - 1) * (n - 2)) if n > 2 else 1.0
+            valores = grafo_ig.betweenness(weights='weight')
+            betweenness = {nome: valor * escala for nome, valor in zip(grafo_ig.vs['name'], valores)}
+        else:
+            k = min(G.number_of_nodes(), AMOSTRAS_CENTRALIDADE)
+            betweenness = nx.betweenness_centrality(G, k=k, weight='weight', normalized=True, seed=0)
         
-        df_pontes = pd.DataFrame(list(betweenness.items()), columns=['Personagem', 'Centralidade de Intermediação'])
-        return df_pontes.sort_values('Centralidade de Intermediação', ascending=False).head(top_n)
+        # Ordena e corta em Python; o DataFrame é montado só com as linhas retornadas
+        pontes = sorted(betweenness.items(), key=itemgetter(1), reverse=True)[:top_n]
+        return pd.DataFrame(pontes, columns=['Personagem', 'Centralidade de Intermediação'])
 
     def obter_estatisticas_comunidades(self, top_n=50):
         """Calcula e retorna estatísticas detalhadas para cada comunidade detectada."""
-        if not community_louvain: return None
+        if not DETECCAO_COMUNIDADES_DISPONIVEL: return None
 
-        G = self._criar_grafo_base(top_n)
+        G = self._obter_grafo_base(top_n)
         if not G: return None
 
-        partition = community_louvain.best_partition(G, weight='weight')
+        partition = self._detectar_comunidades(top_n)
         stats = defaultdict(lambda: {
             'personagens': [], 'frequencia_total': 0, 
             'interacoes_internas': 0, 'interacoes_externas': 0
@@ -402,7 +871,8 @@ class AnalisadorDePersonagens:
         for comm_id in stats:
             stats[comm_id]['personagens'].sort(key=lambda x: x[1], reverse=True)
 
-        return stats
+        # Dicionário comum (e não defaultdict com lambda) para poder ser serializado
+        return dict(stats)
 
 
 # --- BLOCO DE EXECUÇÃO (PARA TESTES E USO EM LINHA DE COMANDO) ---
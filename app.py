@@ -1,10 +1,18 @@
 # --- 1. IMPORTAÇÕES ---
 # Bibliotecas padrão e de terceiros
 import time
+import pickle
+import hashlib
+from pathlib import Path
+
 import streamlit as st
 import streamlit.components.v1 as components
 
-from analisador_personagens import AnalisadorDePersonagens
+from analisador_personagens import AnalisadorDePersonagens, VERSAO_RESULTADOS
+
+# Diretório onde os resultados de cada livro já analisado ficam guardados,
+# identificados pela versão dos resultados e pelo resumo (hash) do conteúdo do arquivo
+DIRETORIO_CACHE = Path(".analysis_cache")
 
 # --- 2. CONFIGURAÇÃO DA PÁGINA E ESTILO ---
 st.set_page_config(
@@ -15,17 +23,39 @@ st.set_page_config(
 )
 
 # --- 3. FUNÇÃO DE ANÁLISE COM CACHE ---
+@st.cache_resource(show_spinner=False)
+def carregar_modelo_nlp():
+    """
+    Carrega o modelo spaCy uma única vez por processo do Streamlit.
+    O mesmo objeto é compartilhado por todas as sessões e análises, evitando
+    lê-lo do disco (e duplicá-lo na memória) a cada novo livro.
+    """
+    return AnalisadorDePersonagens.carregar_modelo()  # (nlp, usa_gpu)
+
 @st.cache_data(show_spinner=False)
-def processar_livro(pdf_bytes, file_name):
+def processar_livro(file_identifier, _pdf_bytes):
     """
     Executa a análise completa do livro.
-    Esta função é "cacheada": o Streamlit armazena o resultado e só a re-executa se os
-    argumentos de entrada (os bytes do PDF ou seu nome) mudarem.
+    Esta função é "cacheada": o Streamlit armazena o resultado e só a re-executa se o
+    identificador do arquivo (o resumo do seu conteúdo) mudar. Os resultados também
+    são gravados em disco, de modo que o mesmo livro, enviado de novo (mesmo com
+    outro nome ou após reiniciar o app), não precisa ser reanalisado.
     """
     # A mensagem de spinner será exibida do lado de fora da função cacheada
     # para melhor controle da interface.
-    analisador = AnalisadorDePersonagens()
-    analisador.analisar_livro(pdf_bytes)
+    nlp, usa_gpu = carregar_modelo_nlp()
+    analisador = AnalisadorDePersonagens(nlp=nlp, usa_gpu=usa_gpu)
+    caminho_cache = DIRETORIO_CACHE / f"v{VERSAO_RESULTADOS}_{file_identifier}.pkl"
+    try:
+        analisador.carregar_resultados(caminho_cache)
+    except (OSError, EOFError, pickle.UnpicklingError, KeyError,
+            AttributeError, ImportError, ValueError, TypeError):
+        # Livro ainda não analisado (ou arquivo de cache ilegível ou incompatível)
+        analisador.analisar_livro(_pdf_bytes)
+        try:
+            analisador.salvar_resultados(caminho_cache)
+        except OSError as e:
+            print(f"Aviso: não foi possível gravar o cache da análise: {e}")
 
     # Gera os resultados estáticos (que não dependem de interação do usuário na interface)
     resultados_visuais = {
@@ -33,10 +63,29 @@ def processar_livro(pdf_bytes, file_name):
         "fig_dispersao": analisador.gerar_grafico_dispersao(),
         "html_rede_relacionamentos": analisador.gerar_rede_relacionamentos(),
         # Guarda o objeto 'analisador' para gerar visualizações dinâmicas posteriormente
+        # (ao ser serializado pelo cache, ele deixa de fora o modelo spaCy)
         "analisador_obj": analisador,
     }
     return resultados_visuais
 
+# As análises abaixo dependem de interação do usuário (abas e slider) e são
+# "cacheadas" pelo identificador do arquivo e pelos parâmetros escolhidos.
+# O analisador começa com '_' para que o Streamlit não tente calcular seu hash.
+@st.cache_data(show_spinner=False)
+def calcular_pontes_narrativas(file_identifier, _analisador):
+    """Retorna a tabela de personagens-ponte do livro identificado por `file_identifier`."""
+    return _analisador.analisar_pontes_narrativas()
+
+@st.cache_data(show_spinner=False)
+def gerar_rede_comunidades(file_identifier, top_n, _analisador):
+    """Retorna o HTML da rede de comunidades para os `top_n` personagens mais frequentes."""
+    return _analisador.gerar_rede_comunidades(top_n=top_n)
+
+@st.cache_data(show_spinner=False)
+def calcular_estatisticas_comunidades(file_identifier, top_n, _analisador):
+    """Retorna as estatísticas de cada comunidade para os `top_n` personagens mais frequentes."""
+    return _analisador.obter_estatisticas_comunidades(top_n=top_n)
+
 # --- 4. INTERFACE PRINCIPAL DA APLICAÇÃO ---
 st.title("📚 Analisador de Personagens em Livros PDF")
 st.markdown("Faça o upload de um livro em formato PDF para analisar a frequência, evolução, relacionamentos e estrutura da narrativa.")
@@ -47,19 +96,23 @@ uploaded_file = st.file_uploader("Arraste e solte seu arquivo PDF aqui ou clique
 # O código a seguir só é executado se um arquivo for carregado
 if uploaded_file is not None:
 
-    # Cria um identificador único para o arquivo. Se o usuário carregar um novo
-    # arquivo (mesmo com o mesmo nome), a análise será refeita.
-    file_identifier = f"{uploaded_file.name}_{uploaded_file.size}"
+    # Cria um identificador único para o arquivo a partir do seu conteúdo. Se o usuário
+    # carregar um novo arquivo (mesmo com o mesmo nome e tamanho), a análise será refeita;
+    # o mesmo arquivo renomeado reaproveita a análise anterior. O resumo é calculado
+    # uma única vez por upload, e não a cada interação com os widgets.
+    if st.session_state.get('uploaded_file_id') != uploaded_file.file_id:
+        st.session_state.file_digest = hashlib.blake2b(uploaded_file.getvalue(), digest_size=16).hexdigest()
+        st.session_state.uploaded_file_id = uploaded_file.file_id
+    file_identifier = st.session_state.file_digest
 
     # Verifica se os resultados já estão na memória da sessão para o arquivo atual.
     # Isso evita reprocessar o arquivo toda vez que o usuário interage com um widget.
     if 'analysis_results' not in st.session_state or st.session_state.get('current_file_id') != file_identifier:
         with st.spinner(f'Analisando o livro "{uploaded_file.name}"... Este processo pode levar alguns minutos. Por favor, aguarde.'):
             start_time = time.time()
-            pdf_bytes = uploaded_file.getvalue()
 
             # Chama a função principal de análise
-            st.session_state.analysis_results = processar_livro(pdf_bytes, uploaded_file.name)
+            st.session_state.analysis_results = processar_livro(file_identifier, uploaded_file.getvalue())
 
             # Armazena o identificador do arquivo na sessão para futuras verificações
             st.session_state.current_file_id = file_identifier
@@ -131,7 +184,7 @@ if uploaded_file is not None:
     with tab4:
         st.subheader("Análise de Personagens-Ponte (Centralidade)")
         st.markdown("Esta análise identifica personagens que são cruciais para o fluxo da história, atuando como conectores entre diferentes grupos ou núcleos da narrativa.")
-        df_pontes = analisador.analisar_pontes_narrativas()
+        df_pontes = calcular_pontes_narrativas(file_identifier, analisador)
         if df_pontes is not None and not df_pontes.empty:
             st.dataframe(df_pontes, use_container_width=True)
             st.info("""
@@ -157,12 +210,12 @@ if uploaded_file is not None:
         )
 
         # Gera e exibe o grafo de comunidades dinamicamente
-        html_comunidades = analisador.gerar_rede_comunidades(top_n=top_n)
+        html_comunidades = gerar_rede_comunidades(file_identifier, top_n, analisador)
         if html_comunidades:
             components.html(html_comunidades, height=800, scrolling=True)
 
             # Exibe estatísticas sobre as comunidades encontradas
-            stats_comunidades = analisador.obter_estatisticas_comunidades(top_n=top_n)
+            stats_comunidades = calcular_estatisticas_comunidades(file_identifier, top_n, analisador)
             if stats_comunidades:
                 st.subheader("Estatísticas das Comunidades")
                 for com_id, stats in sorted(stats_comunidades.items()):
@@ -180,6 +233,7 @@ else:
     # Isso garante que, se um novo arquivo for carregado, a análise seja refeita.
     if 'analysis_results' in st.session_state:
         del st.session_state['analysis_results']
-    if 'current_file_id' in st.session_state:
-        del st.session_state['current_file_id']
+    for chave in ('current_file_id', 'uploaded_file_id', 'file_digest'):
+        if chave in st.session_state:
+            del st.session_state[chave]
     st.info("Aguardando o upload de um arquivo PDF para iniciar a análise.")
\ No newline at end of file